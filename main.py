@@ -1,27 +1,48 @@
 import argparse
-from datetime import datetime
+from datetime import date, datetime
 import os
+from pathlib import Path
 from utils.config_loader import load_config
-from utils.file_handler import create_output_dir, load_notes, write_summary_to_file
-from utils.date_utils import get_date_str, get_week_range
+from utils.file_handler import (
+    append_summary_to_file,
+    create_output_dir,
+    write_summary_to_file,
+)
+from utils.date_utils import get_week_range, parse_date_str
 from services.notes_service import NotesService
-from services.openai_service import OpenAIService
+from services.openai_service import CACHE_DIR, OpenAIService
 from services.reminder_service import ReminderService
 
 from services.learning_service import LearningService
 
+_MEETING_NOTES_TEMPLATE = (
+    "# {date} Meeting Notes - {subject}\n\n"
+    "## Tags\n\n{tags}\n\n"
+    "## Participants\n\n{participants}\n\n"
+    "## Meeting notes\n\n{meeting_notes}\n\n"
+    "## Decisions\n\n{decisions}\n\n"
+    "## Action items\n\n{action_items}\n\n"
+    "## References\n\n{references}\n"
+)
+
+
+def create_openai_service(config, args):
+    return OpenAIService(
+        api_key=config["api_key"],
+        model=config["model"],
+        few_shot=config.get("few_shot", False),
+        max_rpm=config.get("max_rpm"),
+        max_tpm=config.get("max_tpm"),
+        use_batch=args.batch,
+        cache_dir=config.get("cache_dir", CACHE_DIR),
+        no_cache=args.no_cache,
+    )
 
-def process_daily_notes(config, args):
-    notes_service = NotesService(config["daily_notes_file"])
-    openai_service = OpenAIService(api_key=config["api_key"], model=config["model"])
-
-    notes = notes_service.load_notes()
-    today_notes = notes_service.extract_today_notes(notes, args.date)
 
-    if not today_notes:
-        print("No notes found for today.")
+def handle_daily_summary(config, args, result, today_notes):
+    if result is None:
+        print("No daily summary was generated.")
         return
-    result = openai_service.summarize_notes_and_identify_tasks(today_notes)
     summary = result["summary"]
     tasks = result["actionable_items"]
     tags = result["tags"]
@@ -39,7 +60,7 @@ def process_daily_notes(config, args):
 
 def process_weekly_notes(config, args):
     notes_service = NotesService(config["daily_notes_file"])
-    openai_service = OpenAIService(api_key=config["api_key"], model=config["model"])
+    openai_service = create_openai_service(config, args)
 
     notes = notes_service.load_notes()
     weekly_notes = notes_service.extract_weekly_notes(notes, args.date)
@@ -47,9 +68,15 @@ def process_weekly_notes(config, args):
         print("No notes found for the past week.")
         return
 
-    weekly_summary = openai_service.generate_weekly_summary(weekly_notes)
-
-    display_results(weekly_summary, "", "")
+    # Print the summary while it is being generated
+    print("Summary:")
+    weekly_summary = openai_service.generate_weekly_summary(
+        weekly_notes, on_chunk=lambda text: print(text, end="", flush=True)
+    )
+    print()
+    if weekly_summary is None:
+        print("No weekly summary was generated.")
+        return
 
     if not args.dry_run:
         write_weekly_summary(
@@ -62,7 +89,7 @@ def process_weekly_notes(config, args):
 
 def process_meeting_notes(config, args):
     notes_service = NotesService(config["daily_notes_file"])
-    openai_service = OpenAIService(api_key=config["api_key"], model=config["model"])
+    openai_service = create_openai_service(config, args)
 
     notes = notes_service.load_notes()
     today_notes = notes_service.extract_today_notes(notes, args.date)
@@ -71,15 +98,40 @@ def process_meeting_notes(config, args):
         print("No notes found for today.")
         return
 
-    meeting_notes = openai_service.generate_meeting_notes(today_notes)
-    if not args.dry_run:
-        for meeting in meeting_notes["meetings"]:
+    # Handle each meeting as soon as it has been generated
+    handle_meeting_notes(config, args, openai_service.iter_meeting_notes(today_notes))
+
+
+def handle_meeting_notes(config, args, meetings):
+    for meeting in meetings:
+        if not args.dry_run:
             save_meeting_notes(meeting, config["meeting_notes_output_dir"])
-    else:
-        for meeting in meeting_notes["meetings"]:
+        else:
             print(meeting)
 
 
+def process_daily_and_meeting_notes(config, args):
+    notes_service = NotesService(config["daily_notes_file"])
+    openai_service = create_openai_service(config, args)
+
+    notes = notes_service.load_notes()
+    today_notes = notes_service.extract_today_notes(notes, args.date)
+
+    if not today_notes:
+        print("No notes found for today.")
+        return
+
+    # Request the summary and the meeting notes for today's notes concurrently
+    result, meeting_notes = openai_service.summarize_and_generate_meeting_notes(
+        today_notes
+    )
+    handle_daily_summary(config, args, result, today_notes)
+    if meeting_notes is None:
+        print("No meeting notes were generated.")
+        return
+    handle_meeting_notes(config, args, meeting_notes["meetings"])
+
+
 def display_results(summary, tasks, tags):
     print("Summary:")
     print(summary)
@@ -91,71 +143,58 @@ def display_results(summary, tasks, tags):
 
 
 def add_tasks_to_reminders(tasks):
-    for task in tasks:
-        ReminderService.add_to_reminders(task)
+    # Ask about all tasks at once, then create the reminders in one go
+    ReminderService.add_many(ReminderService.confirm_tasks(tasks))
 
 
 def write_daily_summary(
     config, summary, tasks, tags, today_notes, replace_summary, today_str
 ):
     # Prepare the folder structure
+    day = None
     if today_str is not None:
         # Step 2: Validate `today_str` as a date string
-        try:
-            datetime.strptime(today_str, "%Y-%m-%d")
-        except ValueError:
+        day = parse_date_str(today_str)
+        if day is None:
             print("Invalid date string. Using today's date instead.")
-            today_str = get_date_str()
-    else:
-        today_str = get_date_str()
+    if day is None:
+        day = date.today()
+    today_str = day.isoformat()
 
-    # now = datetime.now()
-    now = datetime.strptime(today_str, "%Y-%m-%d")
-    year = now.strftime("%Y")
-    month = now.strftime("%m")
-    week_number = now.strftime("%U")
-    # date_str = get_date_str()
+    year = f"{day.year:04d}"
+    month = f"{day.month:02d}"
+    week_number = day.strftime("%U")
 
     output_dir = create_output_dir(
-        os.path.expanduser(f"{config['daily_output_dir']}/{year}/{month}/{week_number}")
+        f"{config['daily_output_dir']}/{year}/{month}/{week_number}"
     )
     output_file = os.path.join(output_dir, f"{today_str}.md")
 
+    content = create_daily_summary_content(summary, tasks, tags, today_notes)
     if replace_summary or not os.path.exists(output_file):
-        content = create_daily_summary_content(summary, tasks, tags, today_notes)
+        write_summary_to_file(output_file, content)
     else:
-        # Append summary to existing file's content
-        with open(output_file, "r") as file:
-            existing_content = file.read()
-        additional_content = create_daily_summary_content(
-            summary, tasks, tags, today_notes
-        )
-        content = existing_content + "\n\n" + additional_content
-
-    write_summary_to_file(output_file, content)
+        # Append the summary without reading the existing file back in
+        append_summary_to_file(output_file, "\n\n" + content)
 
 
 def write_weekly_summary(config, weekly_summary, weekly_notes, replace_summary):
     # Prepare the output file path
     start_date, end_date = get_week_range()
-    year = start_date.strftime("%Y")
+    year = f"{start_date.year:04d}"
     week_number = start_date.strftime("%U")
 
     output_dir = create_output_dir(
-        os.path.expanduser(f"{config['weekly_output_dir']}/{year}/{week_number}")
+        f"{config['weekly_output_dir']}/{year}/{week_number}"
     )
     output_file = os.path.join(output_dir, f"week_{week_number}_summary.md")
 
+    content = create_weekly_summary_content(weekly_summary, weekly_notes)
     if replace_summary or not os.path.exists(output_file):
-        content = create_weekly_summary_content(weekly_summary, weekly_notes)
+        write_summary_to_file(output_file, content)
     else:
-        # Append weekly summary to existing file's content
-        with open(output_file, "r") as file:
-            existing_content = file.read()
-        additional_content = create_weekly_summary_content(weekly_summary, weekly_notes)
-        content = existing_content + "\n\n" + additional_content
-
-    write_summary_to_file(output_file, content)
+        # Append the weekly summary without reading the existing file back in
+        append_summary_to_file(output_file, "\n\n" + content)
 
 
 def create_daily_summary_content(summary, tasks, tags, today_notes):
@@ -182,7 +221,7 @@ def process_new_learnings(config, args):
     learning_service = LearningService(
         config["learnings_file"], config["learnings_output_dir"]
     )
-    openai_service = OpenAIService(api_key=config["api_key"], model=config["model"])
+    openai_service = create_openai_service(config, args)
 
     print("Starting process_new_learnings")
     learning_service.process_new_learnings(openai_service)
@@ -194,29 +233,27 @@ def save_meeting_notes(meeting_data, output_dir="MeetingNotes"):
     subject = meeting_data.get("meeting_subject", "meeting").replace(" ", "_").lower()
     file_name = f"{date_str}_{subject}.md"
 
-    meeting_notes_content = (
-        f"# {date_str} Meeting Notes - {meeting_data.get('meeting_subject')}\n\n"
-        f"## Tags\n\n{meeting_data.get('tags')}\n\n"
-        "## Participants\n\n"
-        + "\n".join(
-            f"- {participant}" for participant in meeting_data.get("participants")
-        )
-        + "\n\n"
-        f"## Meeting notes\n\n{meeting_data.get('meeting_notes')}\n\n"
-        "## Decisions\n\n" + f"{meeting_data.get('decisions', '')}\n\n"
-        "## Action items\n\n"
-        + "\n".join(
-            f"- {action_item}" for action_item in meeting_data.get("action_items", [])
-        )
-        + "\n\n"
-        f"## References\n\n{meeting_data.get('references')}\n"
+    meeting_notes_content = _MEETING_NOTES_TEMPLATE.format_map(
+        {
+            "date": date_str,
+            "subject": meeting_data.get("meeting_subject"),
+            "tags": meeting_data.get("tags"),
+            "participants": "\n".join(
+                f"- {participant}" for participant in meeting_data.get("participants")
+            ),
+            "meeting_notes": meeting_data.get("meeting_notes"),
+            "decisions": meeting_data.get("decisions", ""),
+            "action_items": "\n".join(
+                f"- {action_item}"
+                for action_item in meeting_data.get("action_items", [])
+            ),
+            "references": meeting_data.get("references"),
+        }
     )
-    output_dir = create_output_dir(os.path.expanduser(f"{output_dir}"))
-    output_file = os.path.join(output_dir, f"{file_name}.md")
+    output_dir = Path(create_output_dir(output_dir))
+    output_file = output_dir / f"{file_name}.md"
 
-    os.makedirs(output_dir, exist_ok=True)
-    with open(output_file, "w") as file:
-        file.write(meeting_notes_content)
+    output_file.write_bytes(meeting_notes_content.encode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -253,6 +290,17 @@ if __name__ == "__main__":
     parser.add_argument(
         "--process-learnings", action="store_true", help="Process new learnings"
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Generate weekly summaries and meeting notes through the OpenAI "
+        "Batch API at half the cost (can take up to 24 hours)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the OpenAI API instead of reusing cached responses",
+    )
     args = parser.parse_args()
 
     config = load_config(args.config)
@@ -263,6 +311,5 @@ if __name__ == "__main__":
     elif args.weekly:
         process_weekly_notes(config, args)
     else:
-        process_daily_notes(config, args)
-        process_meeting_notes(config, args)
+        process_daily_and_meeting_notes(config, args)
         process_new_learnings(config, args)
@@ -2,6 +2,14 @@ import os
 import re
 from utils.file_handler import load_notes, write_summary_to_file, create_output_dir
 
+# An entry runs line by line until the next line that opens with "["
+_LEARNING_RE = re.compile(
+    r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [AP]M)\]([^\n]*(?:\n(?!\[)[^\n]*)*)"
+)
+_TITLE_CHARS_RE = re.compile(r"[^\w\s-]")
+_TITLE_SEPARATORS_RE = re.compile(r"[-\s]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
 
 class LearningService:
     def __init__(self, learnings_file, learnings_output_dir):
@@ -12,16 +20,20 @@ class LearningService:
         return load_notes(self.learnings_file)
 
     def identify_new_learnings(self, content):
-        pattern = r"(\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [AP]M)\](.*?)(?=\n\[|\Z))"
-        matches = re.findall(pattern, content, re.DOTALL)
-        return [
-            (full_match.strip(), timestamp, learning.strip())
-            for full_match, timestamp, learning in matches
-        ]
+        """
+        Yield learnings from the content as they are matched.
+
+        Yields:
+            tuple: (start, end, timestamp, learning) where start/end is the
+            span of the full entry within the content
+        """
+        for match in _LEARNING_RE.finditer(content):
+            timestamp, learning = match.groups()
+            yield match.start(), match.end(), timestamp, learning.strip()
 
     def generate_markdown_file(self, timestamp, learning, title, tags):
-        clean_title = re.sub(r"[^\w\s-]", "", title.lower())
-        clean_title = re.sub(r"[-\s]+", "_", clean_title).strip("-_")
+        clean_title = _TITLE_CHARS_RE.sub("", title.lower())
+        clean_title = _TITLE_SEPARATORS_RE.sub("_", clean_title).strip("-_")
         filename = f"{clean_title}.md"
 
         content = f"# {title}\n\n"
@@ -35,25 +47,36 @@ class LearningService:
 
     def process_new_learnings(self, openai_service):
         content = self.load_learnings()
-        learnings = self.identify_new_learnings(content)
+
+        learnings = list(self.identify_new_learnings(content))
 
         print(f"Processing {len(learnings)} learnings...")
-        for full_match, timestamp, learning in learnings:
+        # One request returns the titles and tags of a whole batch of learnings
+        metadata = openai_service.generate_learning_titles_and_tags(
+            [learning for _, _, _, learning in learnings]
+        )
+
+        create_output_dir(self.learnings_output_dir)
+        # Keep the text between processed learnings, splice it together at the end
+        remaining = []
+        position = 0
+        for (start, end, timestamp, learning), (title, tags) in zip(
+            learnings, metadata
+        ):
             print(f"Processing learning: {learning[:100]}...")
-            title = openai_service.generate_learning_title(learning)
             print(f"Title: {title}")
-            tags = openai_service.generate_learning_tags(learning)
             print(f"Tags: {tags}")
 
-            os.makedirs(self.learnings_output_dir, exist_ok=True)
-
             filename = self.generate_markdown_file(timestamp, learning, title, tags)
 
             # Remove the processed learning from the content
-            content = content.replace(full_match, "").strip()
+            remaining.append(content[position:start])
+            position = end
+
+        remaining.append(content[position:])
 
         # Remove any consecutive newlines
-        content = re.sub(r"\n{3,}", "\n\n", content)
+        content = _BLANK_LINES_RE.sub("\n\n", "".join(remaining).strip())
 
         # Write the updated content back to the file
         write_summary_to_file(self.learnings_file, content)
@@ -1,7 +1,28 @@
-from utils.date_utils import get_date_str
+from utils.date_utils import get_date_str, parse_date_str
+from utils.file_handler import load_notes
 import re
-from datetime import datetime, timedelta
-import os
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from operator import itemgetter
+
+_HEADER_RE = re.compile(r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [AP]M)\] ")
+_ENTRY_START_RE = re.compile(r"\[\d{4}-\d{2}-\d{2}")
+
+
+def _parse_timestamp(timestamp):
+    """Parse a fixed-width "YYYY-MM-DD HH:MM:SS AM" timestamp."""
+    hour = int(timestamp[11:13]) % 12
+    if timestamp[20] == "P":
+        hour += 12
+    return datetime(
+        int(timestamp[0:4]),
+        int(timestamp[5:7]),
+        int(timestamp[8:10]),
+        hour,
+        int(timestamp[14:16]),
+        int(timestamp[17:19]),
+    )
 
 
 class NotesService:
@@ -9,26 +30,28 @@ class NotesService:
         self.note_file = note_file
 
     def load_notes(self):
-        expanded_note_file = os.path.expanduser(self.note_file)
-        with open(expanded_note_file, "r") as file:
-            return file.read()
+        return load_notes(self.note_file)
 
     def extract_today_notes(self, notes, today_str=None):
         # Step 1: Check if `today_str` is not `None`
         if today_str is not None:
             # Step 2: Validate `today_str` as a date string
-            try:
-                datetime.strptime(today_str, "%Y-%m-%d")
-            except ValueError:
+            if parse_date_str(today_str) is None:
                 print("Invalid date string. Using today's date instead.")
                 today_str = get_date_str()
         else:
             today_str = get_date_str()
 
-        pattern = re.compile(
-            rf"\[{today_str}.*?\].*?(?=\[\d{{4}}-\d{{2}}-\d{{2}}|\Z)", re.DOTALL
-        )
-        today_notes = pattern.findall(notes)
+        # Jump between occurrences of the literal date prefix and only use a
+        # regex to find where each entry ends
+        needle = f"[{today_str}"
+        today_notes = []
+        start = notes.find(needle)
+        while start != -1:
+            next_entry = _ENTRY_START_RE.search(notes, start + 1)
+            end = next_entry.start() if next_entry else len(notes)
+            today_notes.append(notes[start:end])
+            start = notes.find(needle, end)
         return "\n".join(today_notes)
 
     def extract_weekly_notes(self, markdown, date_str=None, days=7):
@@ -42,62 +65,67 @@ class NotesService:
         Returns:
             list: List of notes from the last 'days' days
         """
+        day = None
         if date_str is not None:
-            try:
-                datetime.strptime(date_str, "%Y-%m-%d")
-            except ValueError:
+            day = parse_date_str(date_str)
+            if day is None:
                 print("Invalid date string. Using today's date instead.")
-                date_str = get_date_str()
-        else:
-            date_str = get_date_str()
-
-        notes = []
-        # pattern = r"\[(.*?)\] (.*?)(?=\[\d{4}-\d{2}-\d{2}|\Z)"
-        pattern = r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [AP]M)\] (.*?)(?=\[\d{4}-\d{2}-\d{2}|\Z)"
-        for match in re.finditer(pattern, markdown, re.DOTALL):
-            timestamp, note = match.groups()
-            notes.append((timestamp, note.strip()))
-
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        if day is None:
+            day = date.today()
+        date_obj = datetime.combine(day, time())
         end_date = date_obj + timedelta(days=days)
         start_date = date_obj
 
-        recent_notes = [
-            f"{timestamp}: {note}"
-            for timestamp, note in notes
-            if start_date
-            <= datetime.strptime(timestamp, "%Y-%m-%d %I:%M:%S %p")
-            <= end_date
-        ]
-        return "\n".join(recent_notes)
-
-    def save_meeting_notes(meeting_data, output_dir="MeetingNotes"):
-        date_str = meeting_data.get("date", datetime.now().strftime("%Y-%m-%d"))
-        subject = (
-            meeting_data.get("meeting_subject", "meeting").replace(" ", "_").lower()
+        index = self._index_notes(markdown)
+        is_sorted = all(
+            earlier[0] <= later[0] for earlier, later in zip(index, index[1:])
         )
-        file_name = f"{date_str}_{subject}.md"
-
-        meeting_notes_content = (
-            f"# {date_str} Meeting Notes - {meeting_data.get('meeting_subject')}\n\n"
-            f"## Tags\n\n{meeting_data.get('tags')}\n\n"
-            "## Participants\n\n"
-            + "\n".join(
-                f"- {participant}" for participant in meeting_data.get("participants")
-            )
-            + "\n\n"
-            f"## Meeting notes\n\n{meeting_data.get('meeting_notes')}\n\n"
-            "## Decisions\n\n" + f"{meeting_data.get('decisions', '')}\n\n"
-            "## Action items\n\n"
-            + "\n".join(
-                f"- {action_item}"
-                for action_item in meeting_data.get("action_items", [])
+        if is_sorted:
+            # Notes are appended in chronological order, so jump to the first
+            # entry of the window and stop at the first entry past it
+            first = bisect_left(index, start_date, key=itemgetter(0))
+            entries = islice(index, first, None)
+        else:
+            # A hand-edited, backdated entry breaks the order, so check them all
+            entries = index
+        recent_notes = []
+        for timestamp, start, body_start, end in entries:
+            if timestamp > end_date:
+                if is_sorted:
+                    break
+                continue
+            if timestamp < start_date:
+                continue
+            recent_notes.append(
+                f"{markdown[start + 1 : body_start - 2]}: "
+                f"{markdown[body_start:end].strip()}"
             )
-            + "\n\n"
-            f"## References\n\n{meeting_data.get('references')}\n"
-        )
+        return "\n".join(recent_notes)
 
-        os.makedirs(output_dir, exist_ok=True)
-        file_path = os.path.join(output_dir, file_name)
-        with open(file_path, "w") as file:
-            file.write(meeting_notes_content)
+    def _index_notes(self, markdown):
+        """
+        Parse the timestamped entries of a markdown string.
+
+        Returns:
+            list: (timestamp, start, body_start, end) per entry, where the
+            offsets point into the markdown string
+        """
+        # Entries start on a line with a timestamp header and run until the
+        # next header line
+        index = []
+        entry = None
+        offset = 0
+        for line in markdown.splitlines(keepends=True):
+            match = _HEADER_RE.match(line) if line.startswith("[") else None
+            if match:
+                if entry is not None:
+                    index.append((*entry, offset))
+                entry = (
+                    _parse_timestamp(match.group(1)),
+                    offset,
+                    offset + match.end(),
+                )
+            offset += len(line)
+        if entry is not None:
+            index.append((*entry, offset))
+        return index
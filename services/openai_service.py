@@ -1,164 +1,107 @@
-from openai import OpenAI
+import asyncio
+import codecs
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
 
+import httpx
+import tiktoken
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 
-class OpenAIService:
-    def __init__(self, api_key, model="gpt-4o-mini"):
-        self.model = model
-        self.client = OpenAI(api_key=api_key)
+from utils.llm_cache import LLMCache
+from utils.rate_limiter import RateLimiter
 
-    def generate_learning_title(self, learning):
-        prompt = (
-            f"Generate a concise short title for the following learning:\n\n{learning}"
-        )
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-        )
-        return response.choices[0].message.content.strip()
+logger = logging.getLogger(__name__)
 
-    def generate_learning_tags(self, learning):
-        prompt = f"Generate relevant tags for the following learning, formatted in snake-case, each tag should be prefixed with a #-sign, split the tags with a , :\n\n{learning}"
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-        )
-        return [tag.strip() for tag in response.choices[0].message.content.split(",")]
+_RESPONSE_CACHE_SIZE = 1000
+_LEARNING_BATCH_SIZE = 20
+# Notes longer than _MAX_NOTES_TOKENS are summarized in parts of about
+# _CHUNK_TOKENS tokens, which are then combined in a final request
+_MAX_NOTES_TOKENS = 8000
+_CHUNK_TOKENS = 2500
+_TRUNCATION_MARKER = "\n[...]\n"
+# Journal entries start with a "YYYY-MM-DD" timestamp, bracketed in the daily
+# notes and bare in the weekly ones
+_ENTRY_SPLIT_RE = re.compile(r"^(?=\[?\d{4}-\d{2}-\d{2} )", re.MULTILINE)
 
-    def chat_completion_with_function(self, messages, functions, function_call):
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                temperature=0.6,
-                messages=messages,
-                functions=functions,
-                function_call=function_call,
-            )
-            return response.choices[0].message
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
+_LEARNING_METADATA_PROPERTIES = {
+    "title": {"type": "string"},
+    "tags": {"type": "array", "items": {"type": "string"}},
+}
+_BATCH_POLL_INTERVAL = 30
+CACHE_DIR = "~/.cache/gpt-notes-to-tasks"
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
 
-    def summarize_notes_and_identify_tasks(self, notes):
-        prompt = f"""
-        Given the provided journal entries, please generate an easy-to-read daily journal in Markdown format, which captures all the knowledge, links, and facts from the journal entries for future reference. 
-        Following the summary, enumerate any actionable items identified within the journal entries that are actionable by the owner of the notes. 
-        Conclude with a list of relevant tags, formatted in snake-case, that categorize the content or themes of the notes.
-        
-        Example:
-        Journal entry: "[2024-05-21 02:38:09 PM] The team discussed the upcoming project launch, [focusing on the marketing strategy](http://www.link.com), budget allocations, and the final review of the product design. Tasks were assigned to finalize the promotional materials and secure additional funding."
-        
-        Summary: "[02:38:09 PM] Discussed upcoming product launch, [marketing strategies](http://www.link.com), budgeting, and product design finalization."
-        
-        Actionable Items:
-        1. Finalize promotional materials.
-        2. Secure additional funding.
-        
-        Tags: project_launch, marketing_strategy, budget_allocation, product_design
-        
-        Journal entries:\\n{notes}"""
+# Each request sends its instructions (and examples, when enabled) as a
+# system message that stays byte-identical between calls, followed by a user
+# message holding only the notes. OpenAI caches processed prompt prefixes
+# server side, so keeping everything ahead of the notes stable lets repeated
+# calls reuse that work instead of re-processing the long instruction block.
 
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant and a genius summarizer.",
-            },
-            {"role": "user", "content": prompt},
-        ]
+_PERSONA = "You are a helpful assistant and a genius summarizer."
+_NOTES_FOOTER = "The journal entries are provided in the user message."
+_PARTIALS_FOOTER = (
+    "The journal entries were summarized in consecutive parts. The user message "
+    "holds those partial results as a JSON list. Combine them into one result "
+    "that covers all of the entries, merging duplicate items."
+)
 
-        functions = [
-            {
-                "name": "create_meeting_notes",
-                "description": "Create meeting notes from the journal entries.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "summary": {"type": "string"},
-                        "actionable_items": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                        },
-                        "tags": {"type": "array", "items": {"type": "string"}},
-                    },
-                    "required": ["summary", "actionable_items", "tags"],
-                },
-            }
-        ]
-        function_call = {"name": "create_meeting_notes"}
+_SUMMARIZE_INSTRUCTIONS = """Given the provided journal entries, please generate an easy-to-read daily journal in Markdown format, which captures all the knowledge, links, and facts from the journal entries for future reference.
+Following the summary, enumerate any actionable items identified within the journal entries that are actionable by the owner of the notes.
+Conclude with a list of relevant tags, formatted in snake-case, that categorize the content or themes of the notes."""
 
-        response = self.chat_completion_with_function(
-            messages, functions, function_call
-        )
-        if response:
-            meeting_notes_list = eval(response.function_call.arguments)
-            return meeting_notes_list
-        else:
-            return None
+_SUMMARIZE_EXAMPLES = """Example:
+Journal entry: "[2024-05-21 02:38:09 PM] The team discussed the upcoming project launch, [focusing on the marketing strategy](http://www.link.com), budget allocations, and the final review of the product design. Tasks were assigned to finalize the promotional materials and secure additional funding."
 
-    def generate_weekly_summary(self, notes):
-        prompt = f"""
-        Given the provided journal entries, please generate an easy-to-read weekly journal in Markdown format, which captures all the knowledge, links, and facts from the journal entries for future reference. 
-        Following the summary, create a section that enumerates accomplishments based on the journal entries. 
-        Following the accomplishments, create a section called Learnings, and list any learnings identified within the journal entries.
-        
-        Conclude with a list of links extracted from the journal entries, formatted in Markdown and infer a title for each link based on the URL or context in which the link was originally found.
-        
-        Example:
-        Journal entry: "[2024-05-21 02:38:09 PM] The team discussed the upcoming project launch, [focusing on the marketing strategy](http://www.link.com), budget allocations, and the final review of the product design. Tasks were assigned to finalize the promotional materials and secure additional funding."
-        
-        Summary: 
-        - [2024-05-21 02:38:09 PM] Discussed upcoming product launch, focusing on the marketing strategy, budget allocations, and product design finalization.
-        
-        Accomplishments:
-        - Finalized promotional materials.
-        - Secured additional funding.
-        
-        Learnings:
-        - Importance of clear communication in marketing strategies.
-        - Budget allocation challenges.
-        
-        Links:
-        - [Marketing Strategy](http://www.link.com)
-        
-        Weekly journal entries:
-        {notes}
-        """
+Summary: "[02:38:09 PM] Discussed upcoming product launch, [marketing strategies](http://www.link.com), budgeting, and product design finalization."
 
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant and a genius summarizer.",
-            },
-            {"role": "user", "content": prompt},
-        ]
+Actionable Items:
+1. Finalize promotional materials.
+2. Secure additional funding.
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model, messages=messages, max_tokens=1500
-            )
-            print(response)
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return None
+Tags: project_launch, marketing_strategy, budget_allocation, product_design"""
 
-    def generate_meeting_notes(self, notes):
-        prompt = f"""
-From the following journal entries, infer which entries may have been taken during a meeting or call. For each meeting or call, extract details to create meeting notes in Markdown format based on this template:
-# {{date}} Meeting Notes - {{meeting_subject}}
+_WEEKLY_INSTRUCTIONS = """Given the provided journal entries, please generate an easy-to-read weekly journal in Markdown format, which captures all the knowledge, links, and facts from the journal entries for future reference.
+Following the summary, create a section that enumerates accomplishments based on the journal entries.
+Following the accomplishments, create a section called Learnings, and list any learnings identified within the journal entries.
+
+Conclude with a list of links extracted from the journal entries, formatted in Markdown and infer a title for each link based on the URL or context in which the link was originally found."""
+
+_WEEKLY_EXAMPLES = """Example:
+Journal entry: "[2024-05-21 02:38:09 PM] The team discussed the upcoming project launch, [focusing on the marketing strategy](http://www.link.com), budget allocations, and the final review of the product design. Tasks were assigned to finalize the promotional materials and secure additional funding."
+
+Summary:
+- [2024-05-21 02:38:09 PM] Discussed upcoming product launch, focusing on the marketing strategy, budget allocations, and product design finalization.
+
+Accomplishments:
+- Finalized promotional materials.
+- Secured additional funding.
+
+Learnings:
+- Importance of clear communication in marketing strategies.
+- Budget allocation challenges.
+
+Links:
+- [Marketing Strategy](http://www.link.com)"""
+
+_MEETING_INSTRUCTIONS = """From the following journal entries, infer which entries may have been taken during a meeting or call. For each meeting or call, extract details to create meeting notes in Markdown format based on this template:
+# {date} Meeting Notes - {meeting_subject}
 ## Tags
-{{tags}}
+{tags}
 ## Participants
-- {{participant_1}}
-- {{participant_2}}
+- {participant_1}
+- {participant_2}
 ## Meeting notes
-{{meeting_notes}}
+{meeting_notes}
 ## Decisions
 ## Action items
-## References
+## References"""
 
-Example:
+_MEETING_EXAMPLES = """Example:
 Journal entry: "[2024-05-22 01:00:00 PM] Meeting on Project X. Participants: Alice, Bob. Discussed project timelines, potential risks, and mitigation strategies. Decisions made to accelerate phase 1 and review phase 2 next week. Action items: Alice to draft phase 1 report, Bob to set up a client meeting. Reference: [Project docs](http://www.link.com)."
 Journal entry: "[2024-05-22 04:00:00 PM] Call on Project Y. Participants: John. Discussed project budget, marketing strategies. Decisions made to accelerate phase 1 and review phase 2 next week. Action items: Alice to draft phase 1 report, Bob to set up a client meeting. Reference: [Project docs](http://www.link.com)."
 
@@ -191,65 +134,1087 @@ Accelerate phase 1 and review phase 2 next week.
 - Alice to draft phase 1 report.
 - Bob to set up a client meeting.
 ## References
-[Project docs](http://www.link.com)
+[Project docs](http://www.link.com)"""
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _iter_streamed_array(chunks, key):
+    """
+    Yield the items of the `key` array of a JSON object arriving in pieces.
+
+    Each object is decoded as soon as its closing brace has arrived, so the
+    caller can use the first items while the rest are still being generated.
+
+    Args:
+        chunks (iterable): Consecutive pieces of the JSON text
+        key (str): Name of the array of objects to read
+
+    Yields:
+        dict: Each item of the array, in order
+    """
+    array_start = re.compile(rf'"{key}"\s*:\s*\[')
+    buffer = ""
+    position = None
+    for chunk in chunks:
+        buffer += chunk
+        if position is None:
+            match = array_start.search(buffer)
+            if not match:
+                continue
+            position = match.end()
+        elif "}" not in chunk:
+            # No object can have been completed by this chunk
+            continue
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer) or buffer[position] == "]":
+                break
+            try:
+                item, position = _JSON_DECODER.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+
+
+@lru_cache(maxsize=4)
+def _get_client(api_key, max_retries):
+    """
+    Return the client for an API key, creating it on first use.
+
+    Services built with the same key share one client, and with it one HTTP
+    connection pool, so creating a service per run or per request does not
+    redo the TLS handshake.
+    """
+    return OpenAI(
+        api_key=api_key,
+        max_retries=max_retries,
+        http_client=DefaultHttpxClient(limits=_HTTP_LIMITS),
+    )
+
+
+# Async clients per event loop. An open client keeps its loop alive through
+# its connections, so each loop's clients are closed and removed explicitly.
+_async_clients = {}
+
+
+def _get_async_client(api_key, max_retries):
+    """
+    Return the async client for an API key on the running event loop.
+
+    An async connection pool can only be used from the event loop it was
+    created on, and every asyncio.run() starts a new loop, so async clients
+    are shared per loop instead of per process.
+    """
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (api_key, max_retries)
+    if key not in clients:
+        clients[key] = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=max_retries,
+            http_client=DefaultAsyncHttpxClient(limits=_HTTP_LIMITS),
+        )
+    return clients[key]
+
+
+async def _close_async_clients():
+    """Close and forget the async clients of the running event loop."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.close()
+
+
+def _run(coroutine):
+    """Run a coroutine on a new event loop, closing its clients afterwards."""
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await _close_async_clients()
+
+    return asyncio.run(main())
+
+
+@lru_cache(maxsize=8)
+def _encoder(model):
+    """Return the tokenizer for a model, loading its BPE ranks only once."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models tiktoken does not know yet are counted with the GPT-4o encoding
+        return tiktoken.get_encoding("o200k_base")
+
+
+class OpenAIService:
+    def __init__(
+        self,
+        api_key,
+        model="gpt-4o-mini",
+        max_concurrency=5,
+        max_retries=5,
+        few_shot=False,
+        max_rpm=None,
+        max_tpm=None,
+        use_batch=False,
+        cache_dir=CACHE_DIR,
+        no_cache=False,
+    ):
+        self.model = model
+        # The instructions and function schemas already describe the output,
+        # so the worked examples are opt-in rather than sent with every request
+        self.few_shot = few_shot
+        # Send weekly summaries and meeting notes through the Batch API, at
+        # half the price, and wait for the results
+        self.use_batch = use_batch
+        # The SDK retries connection errors, timeouts, 429 and 5xx responses
+        # with exponential backoff and jitter, honouring Retry-After headers
+        self.client = _get_client(api_key, max_retries)
+        self._api_key = api_key
+        self._max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        # Keep concurrent requests within the account's per-minute quotas
+        # instead of running into 429 responses and retrying
+        self._rate_limiter = RateLimiter(max_rpm=max_rpm, max_tpm=max_tpm)
+        self._response_cache = OrderedDict()
+        # Parsed responses are also kept on disk, so re-running on unchanged
+        # notes is answered without calling the API. With no_cache the cache
+        # is not read, but fresh responses still replace the stored ones.
+        self._disk_cache = LLMCache(cache_dir) if cache_dir else None
+        self.no_cache = no_cache
+
+    @property
+    def async_client(self):
+        return _get_async_client(self._api_key, self._max_retries)
+
+    async def aclose(self):
+        """
+        Close the async clients of the running event loop.
+
+        The sync methods do this themselves. Callers awaiting the async
+        methods on their own event loop should await this before the loop
+        is closed.
+        """
+        await _close_async_clients()
+
+    def _system_prompt(self, instructions, examples, footer=_NOTES_FOOTER):
+        parts = [_PERSONA, instructions]
+        if self.few_shot:
+            parts.append(examples)
+        parts.append(footer)
+        return "\n\n".join(parts) + "\n"
+
+    def _cache_key(self, request):
+        payload = json.dumps(request, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _count_tokens(self, text):
+        return len(_encoder(self.model).encode_ordinary(text))
+
+    def _estimate_tokens(self, request):
+        # Without a tokens-per-minute budget the count is never used
+        if not self._rate_limiter.max_tpm:
+            return 0
+        # Prompt tokens plus the completion budget
+        prompt = sum(
+            self._count_tokens(message["content"]) for message in request["messages"]
+        )
+        return prompt + request.get("max_tokens", 0)
+
+    def _cache_get(self, key):
+        if self.no_cache:
+            return None
+        if key not in self._response_cache:
+            if self._disk_cache is None:
+                return None
+            value = self._disk_cache.get(key)
+            if value is not None:
+                self._remember(key, value)
+            return value
+        self._response_cache.move_to_end(key)
+        return self._response_cache[key]
+
+    def _cache_put(self, key, value):
+        self._remember(key, value)
+        if self._disk_cache is not None:
+            self._disk_cache.put(key, value)
+
+    def _remember(self, key, value):
+        self._response_cache[key] = value
+        if len(self._response_cache) > _RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    def _learning_title_request(self, learning):
+        prompt = (
+            f"Generate a concise short title for the following learning:\n\n{learning}"
+        )
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 50,
+        }
+
+    def _learning_tags_request(self, learning):
+        prompt = f"Generate relevant tags for the following learning, formatted in snake-case, each tag should be prefixed with a #-sign, split the tags with a , :\n\n{learning}"
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 50,
+        }
+
+    @staticmethod
+    def _parse_learning_title(response):
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    def _parse_learning_tags(response):
+        return [tag.strip() for tag in response.choices[0].message.content.split(",")]
+
+    def _create(self, request, **options):
+        # Synchronous requests draw from the same per-minute budget as the
+        # concurrent ones
+        self._rate_limiter.wait(self._estimate_tokens(request))
+        return self.client.chat.completions.create(**request, **options)
+
+    async def _acomplete(self, request, parse, accept=None):
+        """
+        Send a request and return its parsed response.
+
+        Identical requests (same model, prompt and options) reuse the
+        previously parsed response instead of calling the API again. When
+        `accept` is given, only results it returns True for are cached or
+        reused.
+        """
+        key = self._cache_key(request)
+        result = self._cache_get(key)
+        if result is None or (accept is not None and not accept(result)):
+            await self._rate_limiter.acquire(self._estimate_tokens(request))
+            result = parse(await self.async_client.chat.completions.create(**request))
+            if accept is None or accept(result):
+                self._cache_put(key, result)
+        return result
+
+    def generate_learning_title(self, learning):
+        """Deprecated: use generate_learning_metadata, which also returns the tags."""
+        return _run(self.agenerate_learning_title(learning))
+
+    def generate_learning_tags(self, learning):
+        """Deprecated: use generate_learning_metadata, which also returns the title."""
+        return _run(self.agenerate_learning_tags(learning))
+
+    async def agenerate_learning_title(self, learning):
+        return await self._acomplete(
+            self._learning_title_request(learning), self._parse_learning_title
+        )
+
+    async def agenerate_learning_tags(self, learning):
+        return await self._acomplete(
+            self._learning_tags_request(learning), self._parse_learning_tags
+        )
+
+    def _learning_metadata_request(self, learning):
+        prompt = (
+            "Generate a concise short title and relevant tags for the following "
+            "learning. Format the tags in snake-case, each prefixed with a "
+            f"#-sign:\n\n{learning}"
+        )
+        return self._function_request(
+            prompt, "learning_metadata", _LEARNING_METADATA_PROPERTIES
+        )
+
+    def _learning_metadata_batch_request(self, learnings):
+        prompt = (
+            "Generate a concise short title and relevant tags for each of the "
+            "following learnings. Format the tags in snake-case, each prefixed "
+            "with a #-sign. Return exactly one entry per learning, in the same "
+            "order:\n\n" + self._number_learnings(learnings)
+        )
+        return self._function_request(
+            prompt,
+            "learnings_metadata",
+            {
+                "learnings": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": _LEARNING_METADATA_PROPERTIES,
+                        "required": list(_LEARNING_METADATA_PROPERTIES),
+                    },
+                }
+            },
+        )
+
+    @staticmethod
+    def _clean_learning_metadata(metadata):
+        return {
+            "title": metadata.get("title", "").strip(),
+            "tags": [tag.strip() for tag in metadata.get("tags", [])],
+        }
+
+    @classmethod
+    def _parse_learning_metadata(cls, response):
+        return cls._clean_learning_metadata(cls._parse_tool_response(response))
+
+    @classmethod
+    def _parse_learning_metadata_batch(cls, response):
+        return [
+            cls._clean_learning_metadata(metadata)
+            for metadata in cls._parse_tool_response(response).get("learnings", [])
+        ]
+
+    def generate_learning_metadata(self, learning):
+        """
+        Generate the title and tags for a learning in a single request.
+
+        Returns:
+            dict: "title" (str) and "tags" (list of str)
+        """
+        return _run(self.agenerate_learning_metadata(learning))
+
+    async def agenerate_learning_metadata(self, learning):
+        return await self._acomplete(
+            self._learning_metadata_request(learning), self._parse_learning_metadata
+        )
+
+    async def agenerate_learning_metadata_batch(self, learnings):
+        return await self._agenerate_batched(
+            learnings,
+            self._learning_metadata_batch_request,
+            self._parse_learning_metadata_batch,
+            self.agenerate_learning_metadata,
+        )
+
+    def _function_request(self, prompt, name, properties):
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "tools": [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "parameters": {
+                            "type": "object",
+                            "properties": properties,
+                            "required": list(properties),
+                        },
+                    },
+                }
+            ],
+            "tool_choice": {"type": "function", "function": {"name": name}},
+        }
+
+    @staticmethod
+    def _number_learnings(learnings):
+        return "\n".join(
+            f"{number}. {learning}" for number, learning in enumerate(learnings, 1)
+        )
+
+    async def _agenerate_batched(self, learnings, build_request, parse, fallback):
+        """
+        Answer up to _LEARNING_BATCH_SIZE learnings per request.
+
+        A batch whose answer does not line up one-to-one with its learnings
+        is retried with one request per learning using `fallback`.
+        """
+
+        # Batch requests and their fallbacks share one concurrency limit. The
+        # semaphore is only held around requests, so a batch waiting on its
+        # fallbacks does not block them.
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch):
+            async with semaphore:
+                # A mismatched answer is not cached, so later runs retry the
+                # batch instead of going straight to the fallback
+                results = await self._acomplete(
+                    build_request(batch),
+                    parse,
+                    accept=lambda results: len(results) == len(batch),
+                )
+            if len(results) != len(batch):
+                results = await self._gather_bounded(
+                    (fallback(learning) for learning in batch), semaphore
+                )
+            return results
+
+        batches = [
+            learnings[i : i + _LEARNING_BATCH_SIZE]
+            for i in range(0, len(learnings), _LEARNING_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [item for batch_results in results for item in batch_results]
+
+    async def _gather_bounded(self, coroutines, semaphore=None):
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
 
-Journal entries:\n{notes}"""
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
 
+        return await asyncio.gather(*(bounded(coroutine) for coroutine in coroutines))
+
+    def generate_learning_titles_and_tags(self, learnings):
+        """
+        Generate titles and tags for several learnings.
+
+        Learnings are sent in batches, with each request returning both the
+        titles and the tags of its batch.
+
+        Args:
+            learnings (list): Learning texts
+
+        Returns:
+            list: (title, tags) per learning, in input order
+        """
+        return _run(self._agenerate_learning_titles_and_tags(learnings))
+
+    async def _agenerate_learning_titles_and_tags(self, learnings):
+        metadata = await self.agenerate_learning_metadata_batch(learnings)
+        return [(item["title"], item["tags"]) for item in metadata]
+
+    def _fit_to_budget(self, text, budget):
+        """
+        Shorten text to at most `budget` tokens, keeping its head and tail.
+
+        The start and end of a note usually carry its context and conclusion,
+        so the middle is dropped and marked with _TRUNCATION_MARKER.
+        """
+        encoder = _encoder(self.model)
+        tokens = encoder.encode_ordinary(text)
+        if len(tokens) <= budget:
+            return text
+        keep = max(budget - self._count_tokens(_TRUNCATION_MARKER), 0)
+        head = keep - keep // 2
+        tail = keep // 2
+        # A cut can fall inside a multi-byte character, whose remaining bytes
+        # are dropped rather than decoded as U+FFFD
+        return (
+            encoder.decode_bytes(tokens[:head]).decode("utf-8", errors="ignore")
+            + _TRUNCATION_MARKER
+            + (
+                encoder.decode_bytes(tokens[-tail:]).decode("utf-8", errors="ignore")
+                if tail
+                else ""
+            )
+        )
+
+    def _split_by_tokens(self, text, target):
+        """Split text into consecutive pieces of about `target` tokens."""
+        encoder = _encoder(self.model)
+        tokens = encoder.encode_ordinary(text)
+        # A multi-byte character cut between two pieces is held back by the
+        # incremental decoder and starts the next piece
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pieces = [
+            decoder.decode(encoder.decode_bytes(tokens[i : i + target]))
+            for i in range(0, len(tokens), target)
+        ]
+        return [piece for piece in pieces if piece]
+
+    def _entry_pieces(self, text, target):
+        """
+        Yield (text, tokens) for each journal entry in text.
+
+        Entries longer than `target` tokens are split at their line breaks,
+        and single lines longer than that into pieces of `target` tokens, so
+        nothing is left out.
+        """
+        for entry in _ENTRY_SPLIT_RE.split(text):
+            if not entry:
+                continue
+            tokens = self._count_tokens(entry)
+            if tokens <= target:
+                yield entry, tokens
+                continue
+            for line in entry.splitlines(keepends=True):
+                tokens = self._count_tokens(line)
+                if tokens <= target:
+                    yield line, tokens
+                    continue
+                for piece in self._split_by_tokens(line, target):
+                    yield piece, self._count_tokens(piece)
+
+    def _chunk_by_tokens(self, text, target=_CHUNK_TOKENS):
+        """
+        Split text into parts of about `target` tokens.
+
+        Parts end where a timestamped journal entry starts, so an entry (and
+        the meeting it describes) is only spread over two parts when it does
+        not fit in one on its own.
+        """
+        chunks = []
+        pieces = []
+        size = 0
+        for piece, tokens in self._entry_pieces(text, target):
+            if pieces and size + tokens > target:
+                chunks.append("".join(pieces).rstrip("\n"))
+                pieces = []
+                size = 0
+            pieces.append(piece)
+            size += tokens
+        if pieces:
+            chunks.append("".join(pieces).rstrip("\n"))
+        return chunks
+
+    def _map_reduce_request(self, notes, build_request, parse):
+        """
+        Build the request for notes, condensing them first when too long.
+
+        Notes over _MAX_NOTES_TOKENS are split into parts that are summarized
+        concurrently with build_request. The request returned then asks for
+        the partial results to be combined, instead of sending all notes in
+        one prompt close to the context limit.
+
+        Args:
+            notes (str): Journal entries
+            build_request (callable): Request builder taking notes and a
+                system prompt footer
+            parse (callable): Parser for the response of each part
+
+        Returns:
+            dict: Request for the final summary
+        """
+        return _run(self._amap_reduce_request(notes, build_request, parse))
+
+    def _split_notes(self, notes):
+        """Return notes as is, or split into parts when over _MAX_NOTES_TOKENS."""
+        if self._count_tokens(notes) <= _MAX_NOTES_TOKENS:
+            return [notes]
+        return self._chunk_by_tokens(notes)
+
+    async def _amap_reduce_request(self, notes, build_request, parse):
+        chunks = self._split_notes(notes)
+        if len(chunks) == 1:
+            return build_request(chunks[0])
+        partials = await self._gather_bounded(
+            self._acomplete(build_request(chunk), parse) for chunk in chunks
+        )
+
+        async def combine(group):
+            if len(group) == 1:
+                return group[0]
+            return await self._acomplete(
+                self._reduce_request(group, build_request), parse
+            )
+
+        # Partial results that together are still too long for one prompt
+        # are combined in groups first, until they fit
+        while (
+            len(partials) > 1
+            and self._count_tokens(self._dump_partials(partials)) > _MAX_NOTES_TOKENS
+        ):
+            partials = await self._gather_bounded(
+                combine(group) for group in self._group_partials(partials)
+            )
+        return self._reduce_request(partials, build_request)
+
+    def _reduce_request(self, partials, build_request):
+        return build_request(
+            self._fit_to_budget(self._dump_partials(partials), _MAX_NOTES_TOKENS),
+            _PARTIALS_FOOTER,
+        )
+
+    @staticmethod
+    def _dump_partials(partials):
+        return json.dumps(partials, ensure_ascii=False, indent=2)
+
+    def _group_partials(self, partials):
+        """
+        Group consecutive partial results to fit within _MAX_NOTES_TOKENS.
+
+        Every group except possibly the last holds at least two results, so
+        each round of combining leaves fewer of them.
+        """
+        groups = [[]]
+        size = 0
+        for partial in partials:
+            tokens = self._count_tokens(self._dump_partials(partial))
+            if len(groups[-1]) >= 2 and size + tokens > _MAX_NOTES_TOKENS:
+                groups.append([])
+                size = 0
+            groups[-1].append(partial)
+            size += tokens
+        return groups
+
+    @staticmethod
+    def _parse_message_content(response):
+        return response.choices[0].message.content
+
+    @classmethod
+    def _parse_tool_response(cls, response):
+        return cls._parse_function_arguments(
+            cls._tool_arguments(response.choices[0].message)
+        )
+
+    @staticmethod
+    def _tool_arguments(message):
+        # Every function-calling request forces a single tool call
+        return message.tool_calls[0].function.arguments
+
+    @staticmethod
+    def _parse_function_arguments(arguments):
+        try:
+            return json.loads(arguments)
+        except json.JSONDecodeError:
+            # The model occasionally answers with single-quoted keys and strings
+            return json.loads(arguments.replace("'", '"'))
+
+    def _function_call_request(self, messages, tools, tool_choice):
+        return {
+            "model": self.model,
+            "temperature": 0.6,
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": tool_choice,
+        }
+
+    def _summarize_request(self, notes, footer=_NOTES_FOOTER):
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful assistant and a genius summarizer.",
+                "content": self._system_prompt(
+                    _SUMMARIZE_INSTRUCTIONS, _SUMMARIZE_EXAMPLES, footer
+                ),
             },
-            {"role": "user", "content": prompt},
+            {"role": "user", "content": notes},
         ]
-        functions = [
+
+        tools = [
             {
-                "name": "create_meeting_notes",
-                "description": "Generate meeting notes from provided journal entries",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "meetings": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "date": {"type": "string"},
-                                    "meeting_subject": {"type": "string"},
-                                    "tags": {"type": "string"},
-                                    "participants": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                    },
-                                    "meeting_notes": {"type": "string"},
-                                    "decisions": {"type": "string"},
-                                    "action_items": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
+                "type": "function",
+                "function": {
+                    "name": "create_meeting_notes",
+                    "description": "Create meeting notes from the journal entries.",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "summary": {"type": "string"},
+                            "actionable_items": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                            },
+                            "tags": {"type": "array", "items": {"type": "string"}},
+                        },
+                        "required": ["summary", "actionable_items", "tags"],
+                    },
+                },
+            }
+        ]
+        tool_choice = {"type": "function", "function": {"name": "create_meeting_notes"}}
+
+        return self._function_call_request(messages, tools, tool_choice)
+
+    def summarize_notes_and_identify_tasks(self, notes):
+        return _run(self.asummarize_notes_and_identify_tasks(notes))
+
+    async def asummarize_notes_and_identify_tasks(self, notes):
+        try:
+            request = await self._amap_reduce_request(
+                notes, self._summarize_request, self._parse_tool_response
+            )
+            return await self._acomplete(request, self._parse_tool_response)
+        except Exception as e:
+            logger.error("An error occurred: %s", e)
+            return None
+
+    def _weekly_summary_request(self, notes, footer=_NOTES_FOOTER):
+        messages = [
+            {
+                "role": "system",
+                "content": self._system_prompt(
+                    _WEEKLY_INSTRUCTIONS, _WEEKLY_EXAMPLES, footer
+                ),
+            },
+            {"role": "user", "content": notes},
+        ]
+
+        return {"model": self.model, "messages": messages, "max_tokens": 1500}
+
+    def stream_weekly_summary(self, notes):
+        """
+        Yield the weekly summary text as the model generates it.
+
+        Args:
+            notes (str): Weekly journal entries
+
+        Yields:
+            str: Consecutive pieces of the Markdown summary
+        """
+        request = self._map_reduce_request(
+            notes, self._weekly_summary_request, self._parse_message_content
+        )
+        key = self._cache_key(request)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        response = self._create(request, stream=True)
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        # Only a stream that was read to the end is cached
+        self._cache_put(key, "".join(parts))
+
+    def generate_weekly_summary(self, notes, on_chunk=None):
+        try:
+            if self.use_batch:
+                summary = self._complete_batch(
+                    self._weekly_summary_batch_requests(notes)
+                )["weekly_summary"]
+                if on_chunk is not None and summary:
+                    on_chunk(summary)
+                return summary
+            parts = []
+            for part in self.stream_weekly_summary(notes):
+                if on_chunk is not None:
+                    on_chunk(part)
+                parts.append(part)
+            return "".join(parts)
+        except Exception as e:
+            logger.error("An error occurred: %s", e)
+            return None
+
+    def _meeting_notes_request(self, notes):
+        messages = [
+            {
+                "role": "system",
+                "content": self._system_prompt(
+                    _MEETING_INSTRUCTIONS, _MEETING_EXAMPLES
+                ),
+            },
+            {"role": "user", "content": notes},
+        ]
+        tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": "create_meeting_notes",
+                    "description": "Generate meeting notes from provided journal entries",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "meetings": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "date": {"type": "string"},
+                                        "meeting_subject": {"type": "string"},
+                                        "tags": {"type": "string"},
+                                        "participants": {
+                                            "type": "array",
+                                            "items": {"type": "string"},
+                                        },
+                                        "meeting_notes": {"type": "string"},
+                                        "decisions": {"type": "string"},
+                                        "action_items": {
+                                            "type": "array",
+                                            "items": {"type": "string"},
+                                        },
+                                        "references": {"type": "string"},
                                     },
-                                    "references": {"type": "string"},
+                                    "required": [
+                                        "date",
+                                        "meeting_subject",
+                                        "tags",
+                                        "participants",
+                                        "meeting_notes",
+                                    ],
                                 },
-                                "required": [
-                                    "date",
-                                    "meeting_subject",
-                                    "tags",
-                                    "participants",
-                                    "meeting_notes",
-                                ],
-                            },
-                        }
+                            }
+                        },
+                        "required": ["meetings"],
                     },
-                    "required": ["meetings"],
                 },
             }
         ]
-        function_call = {"name": "create_meeting_notes"}
+        tool_choice = {"type": "function", "function": {"name": "create_meeting_notes"}}
+
+        return self._function_call_request(messages, tools, tool_choice)
+
+    def generate_meeting_notes(self, notes):
+        if self.use_batch:
+            try:
+                parts = list(
+                    self._complete_batch(
+                        self._meeting_notes_batch_requests(notes)
+                    ).values()
+                )
+            except Exception as e:
+                # Same as the weekly summary: a failed, expired or cancelled
+                # batch is logged instead of raised
+                logger.error("An error occurred: %s", e)
+                return None
+            if all(part is None for part in parts):
+                return None
+            return self._merge_meetings(parts)
+
+        return _run(self.agenerate_meeting_notes(notes))
 
-        response = self.chat_completion_with_function(
-            messages, functions, function_call
+    async def agenerate_meeting_notes(self, notes):
+        # Long notes are split into parts, whose meetings are listed in order
+        results = await self._gather_bounded(
+            self._acomplete(
+                self._meeting_notes_request(chunk), self._parse_tool_response
+            )
+            for chunk in self._split_notes(notes)
         )
+        return self._merge_meetings(results)
+
+    @staticmethod
+    def _merge_meetings(results):
+        """Combine the meeting notes of consecutive parts, skipping failed ones."""
+        return {
+            "meetings": [
+                meeting
+                for result in results
+                if result is not None
+                for meeting in result.get("meetings", [])
+            ]
+        }
+
+    def summarize_and_generate_meeting_notes(self, notes):
+        """
+        Generate the daily summary and the meeting notes for the same notes.
+
+        Both requests are sent concurrently, so the slower of the two sets the
+        wall time instead of their sum.
 
-        # Extract the arguments from the response function call
-        meeting_notes_list = eval(response.function_call.arguments)
+        Returns:
+            tuple: The results of summarize_notes_and_identify_tasks and
+            generate_meeting_notes, with None for a request that failed
+        """
+        return _run(self._asummarize_and_generate_meeting_notes(notes))
+
+    async def _asummarize_and_generate_meeting_notes(self, notes):
+        summary, meeting_notes = await asyncio.gather(
+            self.asummarize_notes_and_identify_tasks(notes),
+            self.agenerate_meeting_notes(notes),
+            return_exceptions=True,
+        )
+        # A failure in one request must not discard the other's result
+        if isinstance(meeting_notes, Exception):
+            logger.error("An error occurred: %s", meeting_notes)
+            meeting_notes = None
+        return summary, meeting_notes
 
-        return meeting_notes_list
+    def iter_meeting_notes(self, notes):
+        """
+        Yield meetings one at a time as the model generates them.
+
+        Args:
+            notes (str): Journal entries
+
+        Yields:
+            dict: Meeting details, in the shape of generate_meeting_notes'
+            "meetings" items
+        """
+        if self.use_batch:
+            meeting_notes = self.generate_meeting_notes(notes) or {}
+            yield from meeting_notes.get("meetings", [])
+            return
+
+        for chunk in self._split_notes(notes):
+            yield from self._stream_meeting_notes(chunk)
+
+    def _stream_meeting_notes(self, notes):
+        # Cached under the same key as the non-streamed request, in the same
+        # {"meetings": [...]} shape
+        request = self._meeting_notes_request(notes)
+        key = self._cache_key(request)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield from cached.get("meetings", [])
+            return
+        response = self._create(request, stream=True)
+        arguments = []
+        meetings = []
+
+        def argument_chunks():
+            for chunk in response:
+                if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                    continue
+                part = chunk.choices[0].delta.tool_calls[0].function.arguments
+                if part:
+                    arguments.append(part)
+                    yield part
+
+        for meeting in _iter_streamed_array(argument_chunks(), "meetings"):
+            meetings.append(meeting)
+            yield meeting
+        if not meetings and arguments:
+            # Fall back to the lenient parser when the arguments are not JSON
+            meetings = self._parse_function_arguments("".join(arguments)).get(
+                "meetings", []
+            )
+            yield from meetings
+        self._cache_put(key, {"meetings": meetings})
+
+    def submit_batch(self, requests):
+        """
+        Submit chat completion requests through the OpenAI Batch API.
+
+        Batched requests cost half as much and do not count against the
+        realtime rate limits, but may take up to 24 hours to complete.
+
+        Args:
+            requests (dict): Request bodies keyed by a custom id
+
+        Returns:
+            str: The id of the created batch
+        """
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+            )
+            for custom_id, body in requests.items()
+        ]
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def enqueue_weekly_summary(self, notes):
+        return self.submit_batch(self._weekly_summary_batch_requests(notes))
+
+    def enqueue_meeting_notes(self, notes):
+        return self.submit_batch(self._meeting_notes_batch_requests(notes))
+
+    def _weekly_summary_batch_requests(self, notes):
+        # A batch cannot wait for its own partial results, so notes too long
+        # for one prompt are shortened instead of summarized in parts
+        return {
+            "weekly_summary": self._weekly_summary_request(
+                self._fit_to_budget(notes, _MAX_NOTES_TOKENS)
+            )
+        }
+
+    def _meeting_notes_batch_requests(self, notes):
+        # One request per part of the notes, numbered in order
+        return {
+            f"meeting_notes_{number}": self._meeting_notes_request(chunk)
+            for number, chunk in enumerate(self._split_notes(notes))
+        }
+
+    def _complete_batch(self, requests):
+        """
+        Send requests through the Batch API and wait for their results.
+
+        Requests answered before are taken from the response cache and only
+        the others are submitted.
+
+        Args:
+            requests (dict): Request bodies keyed by a custom id
+
+        Returns:
+            dict: Parsed results keyed by custom id, in the order of
+            `requests` (None for requests that failed)
+        """
+        keys = {
+            custom_id: self._cache_key(request)
+            for custom_id, request in requests.items()
+        }
+        results = {custom_id: self._cache_get(key) for custom_id, key in keys.items()}
+        missing = {
+            custom_id: requests[custom_id]
+            for custom_id, result in results.items()
+            if result is None
+        }
+        if missing:
+            batch_id = self.submit_batch(missing)
+            batch_results = self.wait_for_batch(batch_id)
+            for custom_id in missing:
+                result = self._batch_result(batch_id, batch_results, custom_id)
+                if result is not None:
+                    self._cache_put(keys[custom_id], result)
+                results[custom_id] = result
+        return results
+
+    def retrieve_batch_results(self, batch_id):
+        """
+        Fetch the results of a batch submitted with submit_batch.
+
+        Returns:
+            dict: Parsed results keyed by custom id, in the same shape as the
+            realtime methods return them (None for requests that failed), or
+            None while the batch is still running
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Batch {batch_id} {batch.status}")
+        if batch.status != "completed":
+            return None
+
+        results = {}
+        if batch.output_file_id:
+            output = self.client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                record = json.loads(line)
+                results[record["custom_id"]] = self._parse_batch_record(record)
+        if batch.error_file_id:
+            # Requests that failed are listed in a separate error file
+            errors = self.client.files.content(batch.error_file_id).text
+            for line in errors.splitlines():
+                record = json.loads(line)
+                logger.error(
+                    "Batch request %s failed: %s",
+                    record["custom_id"],
+                    record.get("error") or record.get("response"),
+                )
+                results[record["custom_id"]] = None
+        return results
+
+    def _parse_batch_record(self, record):
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.error(
+                "Batch request %s failed: %s",
+                record["custom_id"],
+                record.get("error") or response.get("body"),
+            )
+            return None
+        message = response["body"]["choices"][0]["message"]
+        if message.get("tool_calls"):
+            return self._parse_function_arguments(
+                message["tool_calls"][0]["function"]["arguments"]
+            )
+        return message["content"]
+
+    @staticmethod
+    def _batch_result(batch_id, results, custom_id):
+        result = results.get(custom_id)
+        if result is None:
+            logger.error("Batch %s returned no result for %s", batch_id, custom_id)
+        return result
+
+    def wait_for_batch(self, batch_id, poll_interval=_BATCH_POLL_INTERVAL):
+        """
+        Block until a batch has finished and return its results.
+
+        Args:
+            batch_id (str): Id returned by submit_batch
+            poll_interval (int): Seconds between status checks
+
+        Returns:
+            dict: Parsed results keyed by custom id, as returned by
+            retrieve_batch_results
+        """
+        while True:
+            results = self.retrieve_batch_results(batch_id)
+            if results is not None:
+                return results
+            time.sleep(poll_interval)
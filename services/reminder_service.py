@@ -1,29 +1,97 @@
 import applescript
 
+_DECLINE_ANSWERS = {"n", "no", "none"}
+
 
 class ReminderService:
+    @staticmethod
+    def _quote(text):
+        escaped = text.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+
+    @staticmethod
+    def confirm_tasks(tasks):
+        """
+        Ask once which of the tasks should be added to reminders.
+
+        Args:
+            tasks (list): Task descriptions
+
+        Returns:
+            list: The tasks to add, in their original order
+        """
+        if not tasks:
+            return []
+        for number, task in enumerate(tasks, 1):
+            print(f"{number}. {task}")
+        while True:
+            user_input = input(
+                "Enter the numbers of tasks to skip, separated by commas "
+                "(blank to add all, n to add none): "
+            )
+            if user_input.strip().lower() in _DECLINE_ANSWERS:
+                print("Tasks not added to reminders.")
+                return []
+            skipped = ReminderService._parse_task_numbers(user_input, len(tasks))
+            if skipped is not None:
+                return [
+                    task
+                    for number, task in enumerate(tasks, 1)
+                    if number not in skipped
+                ]
+
+    @staticmethod
+    def _parse_task_numbers(user_input, count):
+        """
+        Parse the task numbers entered at the confirmation prompt.
+
+        Returns:
+            set: The numbers entered, or None when any part is not the number
+            of a listed task
+        """
+        numbers = set()
+        for part in user_input.replace(",", " ").split():
+            if not part.isdigit() or not 1 <= int(part) <= count:
+                # Nothing is added on input that cannot be read
+                print(f"'{part}' is not a task number, please try again.")
+                return None
+            numbers.add(int(part))
+        return numbers
+
+    @staticmethod
+    def add_many(tasks):
+        """
+        Add tasks to the "Work" reminders list in a single AppleScript run.
+
+        Args:
+            tasks (list): Task descriptions
+
+        Returns:
+            int: Number of reminders created
+        """
+        if not tasks:
+            return 0
+        task_list = ", ".join(ReminderService._quote(task) for task in tasks)
+        script = f"""
+        set taskList to {{{task_list}}}
+        tell application "Reminders"
+            set mylist to list "Work"
+            tell mylist
+                repeat with taskName in taskList
+                    make new reminder with properties {{name:(taskName as text)}}
+                end repeat
+            end tell
+        end tell
+        """
+        applescript.run(script)
+        return len(tasks)
+
     @staticmethod
     def add_to_reminders(task):
         user_input = input(
             f"Do you want to add the task '{task}' to reminders? (y/n): "
         )
-        if user_input.lower() == "y":
-            # script = f"""
-            # tell application "Reminders"
-            #     set myRemind to (current date) + 1 * days
-            #     set the time of myRemind to 9 * hours
-            #     make new reminder with properties {{name:"{task}", due date:myRemind}}
-            # end tell
-            # """
-            script = f"""
-            tell application "Reminders"
-
-    			set mylist to list "Work"
-                tell mylist 
-                    make new reminder with properties {{name:"{task}"}}
-                end tell
-            end tell
-            """
-            applescript.run(script)
+        if user_input.strip().lower() == "y":
+            ReminderService.add_many([task])
         else:
             print("Task not added to reminders.")
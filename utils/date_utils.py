@@ -1,4 +1,7 @@
-from datetime import datetime, timedelta
+import re
+from datetime import date as date_type, datetime, timedelta
+
+_DATE_RE = re.compile(r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])")
 
 
 def get_date_str(date=None):
@@ -6,6 +9,23 @@ def get_date_str(date=None):
     return date.strftime("%Y-%m-%d")
 
 
+def parse_date_str(date_str):
+    """
+    Parse a "YYYY-MM-DD" date string.
+
+    Returns:
+        date: The parsed date, or None when the string is not a valid date in
+        exactly that format
+    """
+    # fromisoformat alone also accepts forms like "20240521" and "2024-W21-2"
+    if not _DATE_RE.fullmatch(date_str):
+        return None
+    try:
+        return date_type.fromisoformat(date_str)
+    except ValueError:
+        return None
+
+
 def get_week_range():
     today = datetime.now()
     start_of_week = today - timedelta(days=today.weekday())
@@ -1,10 +1,16 @@
 import os
 
+_ensured_dirs = set()
+
 
 def load_notes(filename):
     expanded_filename = os.path.expanduser(filename)
-    with open(expanded_filename, "r") as file:
-        return file.read()
+    # Read the raw bytes in a single call and decode once
+    with open(expanded_filename, "rb", buffering=0) as file:
+        content = file.read().decode("utf-8")
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
 
 
 def write_summary_to_file(filename, content):
@@ -13,8 +19,16 @@ def write_summary_to_file(filename, content):
         file.write(content)
 
 
+def append_summary_to_file(filename, content):
+    expanded_filename = os.path.expanduser(filename)
+    with open(expanded_filename, "a") as file:
+        file.write(content)
+
+
 def create_output_dir(output_dir):
     expanded_dir = os.path.expanduser(output_dir)
-    os.makedirs(expanded_dir, exist_ok=True)
+    # Only hit the filesystem the first time a directory is requested
+    if expanded_dir not in _ensured_dirs:
+        os.makedirs(expanded_dir, exist_ok=True)
+        _ensured_dirs.add(expanded_dir)
     return expanded_dir
-
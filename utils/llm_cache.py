@@ -0,0 +1,51 @@
+import json
+import os
+
+from utils.file_handler import create_output_dir
+
+
+class LLMCache:
+    """
+    Parsed OpenAI responses stored on disk, one JSON file per request hash.
+
+    Entries are touched on every hit, and the least recently used ones are
+    removed once more than `max_entries` are stored.
+    """
+
+    def __init__(self, directory, max_entries=1000):
+        self.directory = create_output_dir(directory)
+        self.max_entries = max_entries
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                value = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        # Write to a temporary file first so a crash never leaves half an entry
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(value, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._prune()
+
+    def _prune(self):
+        with os.scandir(self.directory) as entries:
+            files = [entry for entry in entries if entry.name.endswith(".json")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in files[: len(files) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for requests per minute and tokens per minute.
+
+    Both budgets refill continuously, so bursts are allowed up to one
+    minute's worth of capacity while sustained use is held to the configured
+    rates. A limit of None disables that budget.
+    """
+
+    def __init__(self, max_rpm=None, max_tpm=None):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._requests = float(max_rpm or 0)
+        self._tokens = float(max_tpm or 0)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.max_rpm:
+            self._requests = min(
+                self.max_rpm, self._requests + elapsed * self.max_rpm / 60
+            )
+        if self.max_tpm:
+            self._tokens = min(self.max_tpm, self._tokens + elapsed * self.max_tpm / 60)
+
+    def _reserve(self, tokens):
+        """
+        Take one request and `tokens` tokens from the buckets if available.
+
+        Returns:
+            float: 0 when the budget was taken, otherwise the seconds to wait
+            before trying again
+        """
+        self._refill()
+        # A single request larger than the whole budget waits for a full bucket
+        if self.max_tpm:
+            tokens = min(tokens, self.max_tpm)
+        delay = 0
+        if self.max_rpm and self._requests < 1:
+            delay = (1 - self._requests) * 60 / self.max_rpm
+        if self.max_tpm and self._tokens < tokens:
+            delay = max(delay, (tokens - self._tokens) * 60 / self.max_tpm)
+        if delay:
+            return delay
+        if self.max_rpm:
+            self._requests -= 1
+        if self.max_tpm:
+            self._tokens -= tokens
+        return 0
+
+    async def acquire(self, tokens=0):
+        """Wait until a request of about `tokens` tokens fits both budgets."""
+        # Checking and taking the budget happens without awaiting in between,
+        # so concurrent tasks on the event loop cannot overdraw it
+        while True:
+            delay = self._reserve(tokens)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def wait(self, tokens=0):
+        """Block until a request of about `tokens` tokens fits both budgets."""
+        while True:
+            delay = self._reserve(tokens)
+            if not delay:
+                return
+            time.sleep(delay)